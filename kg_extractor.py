@@ -3,50 +3,160 @@ Knowledge Extractor Module
 Extracts subject-predicate-object triples from text using either LLM or spaCy
 """
 
+import asyncio
 import json
+import os
 import re
-from typing import List, Dict
+import sys
+from typing import Callable, List, Dict, Iterable, Iterator
 import spacy
-from groq import Groq
+from spacy import symbols
+from groq import Groq, AsyncGroq
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_SPACY_BATCH_SIZE = 64
+
+# spaCy components skipped at load time. Extraction reads pos/lemma (tagger,
+# attribute_ruler, lemmatizer) and the dependency parse, but never NER.
+DEFAULT_SPACY_EXCLUDE = ("ner",)
+DEFAULT_LLM_CONCURRENCY = 8
+
+# Output token limit of llama-3.3-70b-versatile on Groq, the cap on a
+# response covering several passages
+MAX_BATCH_TOKENS = 32768
+
+# Opening or closing markdown code fence around an LLM response
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+# Target size of a text chunk; ~2000 characters is roughly 500 tokens
+DEFAULT_CHUNK_CHARS = 2000
+
+# Sentence boundary used when splitting text into chunks
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Integer ID of the POS tag used during extraction, so the token loops
+# compare ints instead of resolving tag strings
+_POS_VERB = symbols.VERB
+
+# Dependency labels used during extraction. ROOT and compound have no spaCy
+# symbol, so the label IDs are looked up in the vocab once the model is loaded.
+_SUBJECT_LABELS = ("nsubj", "nsubjpass")
+_OBJECT_LABELS = ("dobj", "attr", "oprd")
+_MODIFIER_LABELS = ("det", "amod", "compound", "poss")
+
+
+def chunk_text(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> List[str]:
+    """
+    Split text into chunks of whole sentences of at most max_chars characters
+    
+    Args:
+        text: Input text to split
+        max_chars: Target maximum chunk length (a single longer sentence is kept whole)
+        
+    Returns:
+        List of non-empty text chunks in their original order
+    """
+    chunks = []
+    current = ""
+    
+    for paragraph in text.split("\n\n"):
+        for sentence in _SENTENCE_END_RE.split(paragraph.strip()):
+            sentence = " ".join(sentence.split())
+            if not sentence:
+                continue
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
 
 
 class KnowledgeExtractor:
-    def __init__(self, groq_api_key: str = None):
+    def __init__(self, groq_api_key: str = None,
+                 spacy_exclude: Iterable[str] = DEFAULT_SPACY_EXCLUDE):
         """
         Initialize the knowledge extractor
         
         Args:
             groq_api_key: API key for Groq (optional, needed for LLM mode)
+            spacy_exclude: spaCy pipeline components not to load
         """
         self.groq_api_key = groq_api_key
+        self.spacy_exclude = list(spacy_exclude)
         self.nlp = None
+        self._groq_client = None
         
     def _load_spacy_model(self):
         """Load spaCy model lazily"""
         if self.nlp is None:
             try:
-                self.nlp = spacy.load("en_core_web_sm")
+                self.nlp = spacy.load("en_core_web_sm", exclude=self.spacy_exclude)
             except OSError:
                 raise Exception(
                     "spaCy model not found. Please run: "
                     "python -m spacy download en_core_web_sm"
                 )
+            
+            strings = self.nlp.vocab.strings
+            self._dep_root = strings["ROOT"]
+            self._dep_prep = strings["prep"]
+            self._dep_pobj = strings["pobj"]
+            self._subject_deps = frozenset(strings[label] for label in _SUBJECT_LABELS)
+            self._object_deps = frozenset(strings[label] for label in _OBJECT_LABELS)
+            self._modifier_deps = frozenset(strings[label] for label in _MODIFIER_LABELS)
     
-    def extract_with_llm(self, text: str) -> List[Dict[str, str]]:
+    def _get_groq_client(self) -> Groq:
+        """Create the Groq client lazily and reuse it across calls"""
+        if self._groq_client is None:
+            self._groq_client = Groq(api_key=self.groq_api_key)
+        return self._groq_client
+    
+    def _chat_request(self, prompt: str, max_tokens: int = 2000) -> Dict:
         """
-        Extract knowledge triples using Groq LLM
+        Build chat completion arguments around a user prompt
         
         Args:
-            text: Input text to extract knowledge from
+            prompt: User prompt sent to the model
+            max_tokens: Maximum number of tokens in the response
             
         Returns:
-            List of dictionaries with 'subject', 'predicate', 'object' keys
+            Keyword arguments for chat.completions.create
         """
-        if not self.groq_api_key:
-            raise ValueError("Groq API key is required for LLM extraction")
-        
-        client = Groq(api_key=self.groq_api_key)
+        return dict(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a knowledge extraction expert. Extract subject-predicate-object triples and return them as valid JSON."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+    
+    def _build_llm_request(self, text: str) -> Dict:
+        """
+        Build the chat completion arguments for a single text
         
+        Args:
+            text: Input text to extract knowledge from
+            
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
         prompt = f"""Extract knowledge triples from the following text. 
 Return your response as a JSON array of objects, where each object has exactly three fields: 
 "subject", "predicate", and "object".
@@ -62,57 +172,293 @@ Text to analyze:
 
 Return only the JSON array, no additional text or explanation."""
 
-        try:
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a knowledge extraction expert. Extract subject-predicate-object triples and return them as valid JSON."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
-            
-            result = response.choices[0].message.content
-            
-            # Clean the response - remove markdown code blocks if present
-            result = re.sub(r'^```json\s*', '', result)
-            result = re.sub(r'\s*```$', '', result)
-            result = result.strip()
-            
-            # Parse JSON
-            triples = json.loads(result)
-            
-            # Validate structure
-            if not isinstance(triples, list):
-                triples = [triples]
-                
-            # Ensure all triples have required keys
-            valid_triples = []
-            for triple in triples:
-                if all(key in triple for key in ['subject', 'predicate', 'object']):
-                    valid_triples.append({
-                        'subject': str(triple['subject']).strip(),
-                        'predicate': str(triple['predicate']).strip(),
-                        'object': str(triple['object']).strip()
-                    })
-            
-            return valid_triples
+        return self._chat_request(prompt)
+    
+    def _build_batch_request(self, texts: List[str]) -> Dict:
+        """
+        Build the chat completion arguments for several numbered passages
+        
+        Args:
+            texts: Input texts, sent as passages numbered from 1
+            
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
+        passages = "\n\n".join(
+            f"Passage {i}:\n{text}" for i, text in enumerate(texts, 1)
+        )
+        
+        prompt = f"""Extract knowledge triples from each numbered passage below. 
+Return your response as a single JSON object that maps each passage number (as a string) 
+to a JSON array of objects, where each object has exactly three fields: 
+"subject", "predicate", and "object". Use an empty array for a passage with no triples.
+
+Example format:
+{{
+  "1": [{{"subject": "Paris", "predicate": "is capital of", "object": "France"}}],
+  "2": [{{"subject": "Einstein", "predicate": "developed", "object": "theory of relativity"}}]
+}}
+
+{passages}
+
+Return only the JSON object, no additional text or explanation."""
+
+        return self._chat_request(prompt, max_tokens=min(2000 * len(texts), MAX_BATCH_TOKENS))
+    
+    def _load_llm_json(self, result: str, open_char: str, close_char: str):
+        """
+        Isolate and parse the outermost JSON array or object in an LLM response
+        
+        Args:
+            result: Raw message content of the LLM response
+            open_char: Opening bracket of the expected JSON value
+            close_char: Closing bracket of the expected JSON value
             
+        Returns:
+            Parsed JSON value, or None if the response holds no such value
+        """
+        # Clean the response - remove markdown code blocks if present
+        result = _FENCE_RE.sub('', result).strip()
+        
+        # Isolate the JSON value so surrounding chatter is never parsed
+        start = result.find(open_char)
+        end = result.rfind(close_char)
+        if start < 0 or end < start:
+            print("No JSON found in LLM response")
+            print(f"Response was: {result}")
+            return None
+        result = result[start:end + 1]
+        
+        try:
+            return orjson.loads(result) if orjson else json.loads(result)
         except json.JSONDecodeError as e:
             print(f"JSON parsing error: {e}")
             print(f"Response was: {result}")
+            return None
+    
+    def _validate_triples(self, triples) -> List[Dict[str, str]]:
+        """
+        Keep only well-formed triples and normalize their values
+        
+        Args:
+            triples: Parsed JSON value returned by the LLM
+            
+        Returns:
+            List of dictionaries with 'subject', 'predicate', 'object' keys
+        """
+        # Validate structure
+        if not isinstance(triples, list):
+            triples = [triples]
+            
+        # Ensure all triples have required keys
+        valid_triples = []
+        for triple in triples:
+            if isinstance(triple, dict) and all(key in triple for key in ['subject', 'predicate', 'object']):
+                valid_triples.append({
+                    'subject': sys.intern(str(triple['subject']).strip()),
+                    'predicate': sys.intern(str(triple['predicate']).strip()),
+                    'object': sys.intern(str(triple['object']).strip())
+                })
+        
+        return valid_triples
+    
+    def _parse_llm_response(self, result: str, strict: bool = False) -> List[Dict[str, str]]:
+        """
+        Parse and validate the triples returned by the LLM
+        
+        Args:
+            result: Raw message content of the LLM response
+            strict: Raise ValueError for a response holding no valid JSON array
+                instead of returning an empty list
+            
+        Returns:
+            List of dictionaries with 'subject', 'predicate', 'object' keys
+        """
+        triples = self._load_llm_json(result, '[', ']')
+        if triples is None:
+            if strict:
+                raise ValueError("LLM response did not contain a valid JSON array of triples")
             return []
+        
+        return self._validate_triples(triples)
+    
+    def _parse_batch_response(self, result: str, count: int) -> List[List[Dict[str, str]]]:
+        """
+        Parse and validate the per-passage triples of a batched LLM response
+        
+        Args:
+            result: Raw message content of the LLM response
+            count: Number of passages sent in the request
+            
+        Returns:
+            List of triple lists, one per passage, in order, or None if the
+            response is not a JSON object (e.g. it was cut off)
+        """
+        by_passage = self._load_llm_json(result, '{', '}')
+        if not isinstance(by_passage, dict):
+            return None
+        
+        return [
+            self._validate_triples(by_passage.get(str(i), []))
+            for i in range(1, count + 1)
+        ]
+    
+    def extract_with_llm(self, text: str) -> List[Dict[str, str]]:
+        """
+        Extract knowledge triples using Groq LLM
+        
+        Args:
+            text: Input text to extract knowledge from
+            
+        Returns:
+            List of dictionaries with 'subject', 'predicate', 'object' keys
+        """
+        if not self.groq_api_key:
+            raise ValueError("Groq API key is required for LLM extraction")
+        
+        client = self._get_groq_client()
+        
+        try:
+            response = client.chat.completions.create(**self._build_llm_request(text))
+            return self._parse_llm_response(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error during LLM extraction: {e}")
+            return []
+    
+    def extract_with_llm_streaming(self, text: str,
+                                   on_delta: Callable[[str], None]) -> List[Dict[str, str]]:
+        """
+        Extract knowledge triples using Groq LLM, streaming the response as it is generated
+        
+        Args:
+            text: Input text to extract knowledge from
+            on_delta: Called with each new piece of response text
+            
+        Returns:
+            List of dictionaries with 'subject', 'predicate', 'object' keys
+        """
+        if not self.groq_api_key:
+            raise ValueError("Groq API key is required for LLM extraction")
+        
+        client = self._get_groq_client()
+        
+        try:
+            pieces = []
+            stream = client.chat.completions.create(**self._build_llm_request(text), stream=True)
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    pieces.append(delta)
+                    on_delta(delta)
+            return self._parse_llm_response("".join(pieces))
         except Exception as e:
             print(f"Error during LLM extraction: {e}")
             return []
     
+    def extract_batch(self, texts: List[str]) -> List[List[Dict[str, str]]]:
+        """
+        Extract knowledge triples from several texts with a single Groq request
+        
+        Args:
+            texts: Input texts, best kept to around 5-20 per request
+            
+        Returns:
+            List of triple lists, one per input text, in order
+        """
+        if not self.groq_api_key:
+            raise ValueError("Groq API key is required for LLM extraction")
+        
+        client = self._get_groq_client()
+        
+        try:
+            response = client.chat.completions.create(**self._build_batch_request(texts))
+            results = self._parse_batch_response(response.choices[0].message.content, len(texts))
+            if results is None:
+                # Truncated or malformed batch response; retry the passages one at a time
+                results = [self.extract_with_llm(text) for text in texts]
+            return results
+        except Exception as e:
+            print(f"Error during LLM extraction: {e}")
+            return [[] for _ in texts]
+    
+    async def extract_many_llm(self, texts: Iterable[str],
+                               concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                               batch_size: int = 1,
+                               raise_errors: bool = False) -> List[List[Dict[str, str]]]:
+        """
+        Extract knowledge triples from many texts with concurrent Groq requests
+        
+        Args:
+            texts: Iterable of input texts
+            concurrency: Maximum number of requests in flight at once
+            batch_size: Number of texts sent together in one request
+            raise_errors: Raise the error of a failed request or an unparseable
+                response instead of returning empty triple lists for its texts
+            
+        Returns:
+            List of triple lists, one per input text, in order
+        """
+        if not self.groq_api_key:
+            raise ValueError("Groq API key is required for LLM extraction")
+        
+        texts = list(texts)
+        batch_size = max(batch_size, 1)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        
+        client = AsyncGroq(api_key=self.groq_api_key)
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _single(text: str) -> List[Dict[str, str]]:
+            response = await client.chat.completions.create(**self._build_llm_request(text))
+            return self._parse_llm_response(response.choices[0].message.content, strict=raise_errors)
+        
+        async def _one(batch: List[str]) -> List[List[Dict[str, str]]]:
+            async with semaphore:
+                try:
+                    if len(batch) == 1:
+                        return [await _single(batch[0])]
+                    
+                    response = await client.chat.completions.create(**self._build_batch_request(batch))
+                    results = self._parse_batch_response(response.choices[0].message.content, len(batch))
+                    if results is None:
+                        # Truncated or malformed batch response; retry the passages
+                        # one at a time within this request's concurrency slot
+                        results = [await _single(text) for text in batch]
+                    return results
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    print(f"Error during LLM extraction: {e}")
+                    return [[] for _ in batch]
+        
+        try:
+            results = await asyncio.gather(*[_one(batch) for batch in batches])
+        finally:
+            await client.close()
+        
+        return [triples for batch_results in results for triples in batch_results]
+    
+    def extract_many_llm_sync(self, texts: Iterable[str],
+                              concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                              batch_size: int = 1,
+                              raise_errors: bool = False) -> List[List[Dict[str, str]]]:
+        """
+        Blocking wrapper around extract_many_llm
+        
+        Args:
+            texts: Iterable of input texts
+            concurrency: Maximum number of requests in flight at once
+            batch_size: Number of texts sent together in one request
+            raise_errors: Raise the error of a failed request or an unparseable
+                response instead of returning empty triple lists for its texts
+            
+        Returns:
+            List of triple lists, one per input text, in order
+        """
+        return asyncio.run(self.extract_many_llm(
+            texts, concurrency=concurrency, batch_size=batch_size, raise_errors=raise_errors
+        ))
+    
     def extract_with_spacy(self, text: str) -> List[Dict[str, str]]:
         """
         Extract knowledge triples using spaCy NLP
@@ -123,9 +469,54 @@ Return only the JSON array, no additional text or explanation."""
         Returns:
             List of dictionaries with 'subject', 'predicate', 'object' keys
         """
+        # Long texts are parsed as a batch of paragraphs; sentence boundaries
+        # within a paragraph are left to spaCy's parser
+        paragraphs = [paragraph.strip() for paragraph in text.split("\n\n") if paragraph.strip()]
+        return [
+            triple
+            for paragraph_triples in self.extract_many(paragraphs)
+            for triple in paragraph_triples
+        ]
+    
+    def extract_many(self, texts: Iterable[str], batch_size: int = None,
+                     n_process: int = None) -> Iterator[List[Dict[str, str]]]:
+        """
+        Extract knowledge triples from many texts in one spaCy pipeline run
+        
+        For large workloads (more than ~1k documents) parsing can be spread
+        over worker processes, e.g. n_process=os.cpu_count() - 1 with
+        batch_size=50. Keep n_process=1 when running spaCy on a GPU.
+        
+        Args:
+            texts: Iterable of input texts
+            batch_size: Number of texts buffered per spaCy batch
+                (defaults to KG_SPACY_BATCH_SIZE or 64)
+            n_process: Number of processes used by nlp.pipe, -1 for all CPUs
+                (defaults to KG_SPACY_N_PROCESS or 1)
+            
+        Yields:
+            List of triple dictionaries for each input text, in order
+        """
         self._load_spacy_model()
         
-        doc = self.nlp(text)
+        if batch_size is None:
+            batch_size = int(os.getenv("KG_SPACY_BATCH_SIZE", DEFAULT_SPACY_BATCH_SIZE))
+        if n_process is None:
+            n_process = int(os.getenv("KG_SPACY_N_PROCESS", 1))
+        
+        for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+            yield self._triples_from_doc(doc)
+    
+    def _triples_from_doc(self, doc) -> List[Dict[str, str]]:
+        """
+        Extract knowledge triples from a parsed spaCy document
+        
+        Args:
+            doc: spaCy Doc
+            
+        Returns:
+            List of dictionaries with 'subject', 'predicate', 'object' keys
+        """
         triples = []
         
         for sent in doc.sents:
@@ -135,24 +526,27 @@ Return only the JSON array, no additional text or explanation."""
             
             # Find the root verb (predicate)
             for token in sent:
-                if token.pos_ == "VERB" and token.dep_ == "ROOT":
+                if token.pos == _POS_VERB and token.dep == self._dep_root:
                     predicate = token.lemma_
                     
+                    # Map each token to the noun chunk containing it
+                    chunk_map = {t.i: chunk for chunk in sent.noun_chunks for t in chunk}
+                    
                     # Find subject
                     for child in token.children:
-                        if child.dep_ in ("nsubj", "nsubjpass"):
-                            subject = self._get_full_phrase(child)
+                        if child.dep in self._subject_deps:
+                            subject = self._get_full_phrase(child, chunk_map)
                         
                         # Find object
-                        elif child.dep_ in ("dobj", "attr", "oprd"):
-                            obj = self._get_full_phrase(child)
+                        elif child.dep in self._object_deps:
+                            obj = self._get_full_phrase(child, chunk_map)
                         
                         # Find prepositional objects
-                        elif child.dep_ == "prep":
+                        elif child.dep == self._dep_prep:
                             for prep_child in child.children:
-                                if prep_child.dep_ == "pobj":
+                                if prep_child.dep == self._dep_pobj:
                                     if not obj:  # Only use if we don't have a direct object
-                                        obj = self._get_full_phrase(prep_child)
+                                        obj = self._get_full_phrase(prep_child, chunk_map)
                                         predicate = f"{predicate} {child.text}"
             
             # Add triple if we have all components
@@ -165,21 +559,28 @@ Return only the JSON array, no additional text or explanation."""
         
         return triples
     
-    def _get_full_phrase(self, token) -> str:
+    def _get_full_phrase(self, token, chunk_map: Dict = None) -> str:
         """
         Get the full phrase including modifiers for a token
         
         Args:
             token: spaCy token
+            chunk_map: Optional mapping of token index to its noun chunk
             
         Returns:
             Full phrase as string
         """
+        # Prefer the noun chunk spaCy already built for this token
+        if chunk_map:
+            chunk = chunk_map.get(token.i)
+            if chunk is not None:
+                return chunk.text
+        
         # Get all children tokens
         phrase_tokens = [token]
         
         for child in token.children:
-            if child.dep_ in ("det", "amod", "compound", "poss"):
+            if child.dep in self._modifier_deps:
                 phrase_tokens.append(child)
         
         # Sort by position in sentence
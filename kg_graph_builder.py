@@ -6,13 +6,27 @@ Builds and visualizes knowledge graphs from triples
 import networkx as nx
 import matplotlib.pyplot as plt
 from typing import List, Dict
+import heapq
 import io
+import json
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from kg_triples import dedupe_triples
+
+# Graphs larger than this are laid out with Graphviz sfdp when pygraphviz is available
+SFDP_NODE_THRESHOLD = 100
 
 
 class GraphBuilder:
     def __init__(self):
         """Initialize the graph builder"""
         self.graph = None
+        self._layout_cache = {}
     
     def build_graph(self, triples: List[Dict[str, str]]) -> nx.DiGraph:
         """
@@ -25,17 +39,56 @@ class GraphBuilder:
             NetworkX directed graph
         """
         self.graph = nx.DiGraph()
+        triples = dedupe_triples(triples)
         
-        for triple in triples:
-            subject = triple['subject']
-            predicate = triple['predicate']
-            obj = triple['object']
-            
-            # Add edge with predicate as label
-            self.graph.add_edge(subject, obj, label=predicate)
+        # Add all edges in one call with predicate as label; a repeated
+        # subject/object pair keeps the last predicate seen. Names are
+        # interned so repeated entities share one string object.
+        self.graph.add_edges_from(
+            (
+                sys.intern(triple['subject']),
+                sys.intern(triple['object']),
+                {'label': sys.intern(triple['predicate'])}
+            )
+            for triple in triples
+        )
         
         return self.graph
     
+    def _compute_layout(self) -> Dict:
+        """
+        Compute node positions, reusing the cached layout for an unchanged edge set
+        
+        Returns:
+            Dictionary mapping nodes to (x, y) positions
+        """
+        key = frozenset(self.graph.edges())
+        if key in self._layout_cache:
+            return self._layout_cache[key]
+        
+        num_nodes = self.graph.number_of_nodes()
+        pos = None
+        
+        if num_nodes > SFDP_NODE_THRESHOLD:
+            try:
+                from networkx.drawing.nx_agraph import graphviz_layout
+                pos = graphviz_layout(self.graph, prog='sfdp')
+            except Exception:
+                # pygraphviz missing, sfdp not installed, or the layout run
+                # failed; fall back to the spring layout below
+                pos = None
+        
+        if pos is None:
+            if num_nodes <= 10:
+                pos = nx.spring_layout(self.graph, k=2, iterations=50, seed=42)
+            elif num_nodes <= 30:
+                pos = nx.spring_layout(self.graph, k=1, iterations=50, seed=42)
+            else:
+                pos = nx.spring_layout(self.graph, k=1, iterations=20, seed=42)
+        
+        self._layout_cache[key] = pos
+        return pos
+    
     def visualize(self, figsize=(14, 10), save_path=None):
         """
         Visualize the knowledge graph
@@ -55,10 +108,7 @@ class GraphBuilder:
         fig, ax = plt.subplots(figsize=figsize)
         
         # Calculate layout
-        if len(self.graph.nodes()) <= 10:
-            pos = nx.spring_layout(self.graph, k=2, iterations=50, seed=42)
-        else:
-            pos = nx.spring_layout(self.graph, k=1, iterations=50, seed=42)
+        pos = self._compute_layout()
         
         # Draw nodes
         nx.draw_networkx_nodes(
@@ -124,11 +174,15 @@ class GraphBuilder:
         if self.graph is None:
             return {}
         
+        num_nodes = self.graph.number_of_nodes()
+        num_edges = self.graph.number_of_edges()
+        
         return {
-            'num_nodes': self.graph.number_of_nodes(),
-            'num_edges': self.graph.number_of_edges(),
+            'num_nodes': num_nodes,
+            'num_edges': num_edges,
             'num_connected_components': nx.number_weakly_connected_components(self.graph),
-            'avg_degree': sum(dict(self.graph.degree()).values()) / max(self.graph.number_of_nodes(), 1),
+            # Every edge adds one to an out-degree and one to an in-degree
+            'avg_degree': 2 * num_edges / max(num_nodes, 1),
             'density': nx.density(self.graph)
         }
     
@@ -145,21 +199,28 @@ class GraphBuilder:
         if self.graph is None or len(self.graph.nodes()) == 0:
             return []
         
-        # Calculate degree centrality
-        centrality = nx.degree_centrality(self.graph)
+        num_nodes = self.graph.number_of_nodes()
+        if num_nodes == 1:
+            # Matches nx.degree_centrality for a single-node graph
+            return [(node, 1.0) for node in self.graph.nodes()][:top_n]
         
-        # Sort by centrality score
-        sorted_nodes = sorted(centrality.items(), key=lambda x: x[1], reverse=True)
+        # Degree centrality is degree / (n - 1); only the top N are ranked
+        scale = 1 / (num_nodes - 1)
         
-        return sorted_nodes[:top_n]
+        return heapq.nlargest(
+            top_n,
+            ((node, degree * scale) for node, degree in self.graph.degree()),
+            key=lambda x: x[1]
+        )
     
-    def find_paths(self, source: str, target: str) -> List[List[str]]:
+    def find_paths(self, source: str, target: str, cutoff: int = None) -> List[List[str]]:
         """
         Find all simple paths between two nodes
         
         Args:
             source: Source node
             target: Target node
+            cutoff: Optional maximum path length, bounding the enumeration
             
         Returns:
             List of paths (each path is a list of nodes)
@@ -168,11 +229,30 @@ class GraphBuilder:
             return []
         
         try:
-            paths = list(nx.all_simple_paths(self.graph, source, target))
+            paths = list(nx.all_simple_paths(self.graph, source, target, cutoff=cutoff))
             return paths
         except (nx.NodeNotFound, nx.NetworkXNoPath):
             return []
     
+    def shortest_path(self, source: str, target: str) -> List[str]:
+        """
+        Find the shortest path between two nodes
+        
+        Args:
+            source: Source node
+            target: Target node
+            
+        Returns:
+            Path as a list of nodes, or an empty list if none exists
+        """
+        if self.graph is None:
+            return []
+        
+        try:
+            return nx.bidirectional_shortest_path(self.graph, source, target)
+        except (nx.NodeNotFound, nx.NetworkXNoPath):
+            return []
+    
     def export_to_dict(self) -> Dict:
         """
         Export graph to dictionary format
@@ -186,14 +266,26 @@ class GraphBuilder:
         nodes = [{'id': node} for node in self.graph.nodes()]
         edges = [
             {
-                'source': edge[0],
-                'target': edge[1],
-                'label': self.graph.edges[edge].get('label', '')
+                'source': source,
+                'target': target,
+                'label': label
             }
-            for edge in self.graph.edges()
+            for source, target, label in self.graph.edges(data='label', default='')
         ]
         
         return {'nodes': nodes, 'edges': edges}
+    
+    def export_to_json_bytes(self) -> bytes:
+        """
+        Export graph to UTF-8 encoded JSON
+        
+        Returns:
+            JSON bytes of the export_to_dict representation
+        """
+        data = self.export_to_dict()
+        if orjson:
+            return orjson.dumps(data)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
 if __name__ == "__main__":
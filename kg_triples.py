@@ -0,0 +1,53 @@
+"""
+Triple Utilities Module
+Helpers shared by the graph builder and the Neo4j handler for working with triples
+"""
+
+from typing import List, Dict, Tuple
+
+
+def _canonicalize(triple: Dict[str, str], predicate_synonyms: Dict[str, str] = None) -> Tuple[str, str, str]:
+    """
+    Build the canonical signature of a triple
+    
+    Args:
+        triple: Dictionary with 'subject', 'predicate', 'object' keys
+        predicate_synonyms: Optional map of lowercase predicates to a canonical predicate
+        
+    Returns:
+        Lowercased, whitespace-stripped (subject, predicate, object) tuple
+    """
+    predicate = triple['predicate'].strip().lower()
+    if predicate_synonyms:
+        predicate = predicate_synonyms.get(predicate, predicate)
+    
+    return (
+        triple['subject'].strip().lower(),
+        predicate,
+        triple['object'].strip().lower()
+    )
+
+
+def dedupe_triples(triples: List[Dict[str, str]],
+                   predicate_synonyms: Dict[str, str] = None) -> List[Dict[str, str]]:
+    """
+    Remove duplicate triples, keeping the first occurrence of each
+    
+    Args:
+        triples: List of dictionaries with 'subject', 'predicate', 'object' keys
+        predicate_synonyms: Optional map of lowercase predicates to a canonical
+            predicate (e.g. {'capital of': 'is capital of'})
+        
+    Returns:
+        List of unique triples in their original order
+    """
+    seen = set()
+    unique = []
+    
+    for triple in triples:
+        signature = _canonicalize(triple, predicate_synonyms)
+        if signature not in seen:
+            seen.add(signature)
+            unique.append(triple)
+    
+    return unique
\ No newline at end of file
@@ -3,15 +3,38 @@ Neo4j Handler Module
 Handles all Neo4j database operations for knowledge graph storage
 """
 
-from typing import List, Dict, Optional
-from py2neo import Graph, Node, Relationship
+from typing import List, Dict, Iterator, Optional
+from neo4j import GraphDatabase
 import logging
 
+from kg_triples import dedupe_triples
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum number of triples sent per UNWIND query
+STORE_CHUNK_SIZE = 5000
+
+# Number of records pulled per round-trip when streaming results
+STREAM_FETCH_SIZE = 1000
+
+# Connection pool settings for the Neo4j driver
+MAX_CONNECTION_POOL_SIZE = 50
+CONNECTION_ACQUISITION_TIMEOUT = 30
+
+# Indexes backing MERGE and graph_name lookups; the relationship index needs Neo4j 5
+INDEX_QUERIES = [
+    "CREATE INDEX entity_name IF NOT EXISTS FOR (e:Entity) ON (e.name)",
+    "CREATE INDEX entity_graph IF NOT EXISTS FOR (e:Entity) ON (e.graph_name)",
+    "CREATE INDEX entity_name_graph IF NOT EXISTS FOR (e:Entity) ON (e.name, e.graph_name)",
+    "CREATE INDEX relation_graph IF NOT EXISTS FOR ()-[r:RELATION]-() ON (r.graph_name)",
+]
+
 
 class Neo4jHandler:
+    # Database URIs whose indexes were already created by this process
+    _indexed_uris = set()
+    
     def __init__(self, uri: str, user: str, password: str):
         """
         Initialize Neo4j database connection
@@ -22,16 +45,90 @@ class Neo4jHandler:
             password: Database password
         """
         try:
-            self.graph = Graph(uri, auth=(user, password))
+            self._driver = GraphDatabase.driver(
+                uri,
+                auth=(user, password),
+                max_connection_pool_size=MAX_CONNECTION_POOL_SIZE,
+                connection_acquisition_timeout=CONNECTION_ACQUISITION_TIMEOUT
+            )
+            self._driver.verify_connectivity()
             logger.info(f"Successfully connected to Neo4j at {uri}")
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}")
             raise
+        
+        self._create_indexes(uri)
+    
+    def close(self):
+        """Close the driver and release all pooled connections"""
+        self._driver.close()
+    
+    def _read(self, query: str, **params) -> List[Dict]:
+        """
+        Run a read query in a managed transaction
+        
+        Args:
+            query: Cypher query
+            **params: Query parameters
+            
+        Returns:
+            List of result rows as dictionaries
+        """
+        with self._driver.session() as session:
+            return session.execute_read(lambda tx: tx.run(query, **params).data())
+    
+    def _stream(self, query: str, **params) -> Iterator[Dict]:
+        """
+        Run a read query and yield rows as the server streams them
+        
+        Args:
+            query: Cypher query
+            **params: Query parameters
+            
+        Yields:
+            Result rows as dictionaries
+        """
+        with self._driver.session(fetch_size=STREAM_FETCH_SIZE) as session:
+            for record in session.run(query, **params):
+                yield record.data()
+    
+    def _write(self, query: str, **params) -> List[Dict]:
+        """
+        Run a write query in a managed transaction, retried on transient errors
+        
+        Args:
+            query: Cypher query
+            **params: Query parameters
+            
+        Returns:
+            List of result rows as dictionaries
+        """
+        with self._driver.session() as session:
+            return session.execute_write(lambda tx: tx.run(query, **params).data())
+    
+    def _create_indexes(self, uri: str):
+        """
+        Create the indexes backing entity and relationship lookups
+        
+        Args:
+            uri: Neo4j database URI, used to only create indexes once per database
+        """
+        if uri in Neo4jHandler._indexed_uris:
+            return
+        
+        for query in INDEX_QUERIES:
+            try:
+                with self._driver.session() as session:
+                    session.run(query).consume()
+            except Exception as e:
+                logger.warning(f"Could not create Neo4j index: {e}")
+        
+        Neo4jHandler._indexed_uris.add(uri)
     
     def clear_database(self):
         """Clear all nodes and relationships from the database"""
         try:
-            self.graph.delete_all()
+            self._write("MATCH (n) DETACH DELETE n")
             logger.info("Database cleared successfully")
         except Exception as e:
             logger.error(f"Error clearing database: {e}")
@@ -49,29 +146,29 @@ class Neo4jHandler:
             logger.warning("No triples to store")
             return
         
+        triples = dedupe_triples(triples)
+        rows = [
+            {'s': t['subject'], 'p': t['predicate'], 'o': t['object']}
+            for t in triples
+        ]
+        
+        # Merge every triple through a single UNWIND query per chunk
+        query = """
+        UNWIND $rows AS row
+        MERGE (s:Entity {name: row.s})
+        SET s.graph_name = $graph_name
+        MERGE (o:Entity {name: row.o})
+        SET o.graph_name = $graph_name
+        MERGE (s)-[r:RELATION {type: row.p, graph_name: $graph_name}]->(o)
+        """
+        
+        def _store(tx):
+            for start in range(0, len(rows), STORE_CHUNK_SIZE):
+                tx.run(query, rows=rows[start:start + STORE_CHUNK_SIZE], graph_name=graph_name).consume()
+        
         try:
-            for triple in triples:
-                subject = triple['subject']
-                predicate = triple['predicate']
-                obj = triple['object']
-                
-                # Create Cypher query to merge nodes and relationships
-                query = """
-                MERGE (s:Entity {name: $subject})
-                SET s.graph_name = $graph_name
-                MERGE (o:Entity {name: $object})
-                SET o.graph_name = $graph_name
-                MERGE (s)-[r:RELATION {type: $predicate, graph_name: $graph_name}]->(o)
-                RETURN s, r, o
-                """
-                
-                self.graph.run(
-                    query,
-                    subject=subject,
-                    predicate=predicate,
-                    object=obj,
-                    graph_name=graph_name
-                )
+            with self._driver.session() as session:
+                session.execute_write(_store)
             
             logger.info(f"Successfully stored {len(triples)} triples in graph '{graph_name}'")
             
@@ -79,6 +176,36 @@ class Neo4jHandler:
             logger.error(f"Error storing triples: {e}")
             raise
     
+    def fetch_entity_relationships(self, entity_name: str, graph_name: str = None) -> List[Dict]:
+        """
+        Fetch all relationships for a specific entity, raising on query errors
+        
+        Args:
+            entity_name: Name of the entity to query
+            graph_name: Optional graph name filter
+            
+        Returns:
+            List of relationship dictionaries
+        """
+        if graph_name:
+            query = """
+            MATCH (e:Entity {name: $name, graph_name: $graph_name})-[r]->(o)
+            RETURN e.name as subject, r.type as predicate, o.name as object
+            UNION
+            MATCH (s)-[r]->(e:Entity {name: $name, graph_name: $graph_name})
+            RETURN s.name as subject, r.type as predicate, e.name as object
+            """
+            return self._read(query, name=entity_name, graph_name=graph_name)
+        
+        query = """
+        MATCH (e:Entity {name: $name})-[r]->(o)
+        RETURN e.name as subject, r.type as predicate, o.name as object
+        UNION
+        MATCH (s)-[r]->(e:Entity {name: $name})
+        RETURN s.name as subject, r.type as predicate, e.name as object
+        """
+        return self._read(query, name=entity_name)
+    
     def query_entity_relationships(self, entity_name: str, graph_name: str = None) -> List[Dict]:
         """
         Query all relationships for a specific entity
@@ -91,31 +218,32 @@ class Neo4jHandler:
             List of relationship dictionaries
         """
         try:
-            if graph_name:
-                query = """
-                MATCH (e:Entity {name: $name, graph_name: $graph_name})-[r]->(o)
-                RETURN e.name as subject, r.type as predicate, o.name as object
-                UNION
-                MATCH (s)-[r]->(e:Entity {name: $name, graph_name: $graph_name})
-                RETURN s.name as subject, r.type as predicate, e.name as object
-                """
-                results = self.graph.run(query, name=entity_name, graph_name=graph_name).data()
-            else:
-                query = """
-                MATCH (e:Entity {name: $name})-[r]->(o)
-                RETURN e.name as subject, r.type as predicate, o.name as object
-                UNION
-                MATCH (s)-[r]->(e:Entity {name: $name})
-                RETURN s.name as subject, r.type as predicate, e.name as object
-                """
-                results = self.graph.run(query, name=entity_name).data()
-            
-            return results
+            return self.fetch_entity_relationships(entity_name, graph_name)
             
         except Exception as e:
             logger.error(f"Error querying entity relationships: {e}")
             return []
     
+    def iter_all_entities(self, graph_name: str = None) -> Iterator[str]:
+        """
+        Stream all entity names from the database
+        
+        Args:
+            graph_name: Optional graph name filter
+            
+        Yields:
+            Entity names as they arrive from the server
+        """
+        if graph_name:
+            query = "MATCH (e:Entity {graph_name: $graph_name}) RETURN e.name as name"
+            records = self._stream(query, graph_name=graph_name)
+        else:
+            query = "MATCH (e:Entity) RETURN e.name as name"
+            records = self._stream(query)
+        
+        for record in records:
+            yield record['name']
+    
     def get_all_entities(self, graph_name: str = None) -> List[str]:
         """
         Get all entity names from the database
@@ -127,19 +255,38 @@ class Neo4jHandler:
             List of entity names
         """
         try:
-            if graph_name:
-                query = "MATCH (e:Entity {graph_name: $graph_name}) RETURN e.name as name"
-                results = self.graph.run(query, graph_name=graph_name).data()
-            else:
-                query = "MATCH (e:Entity) RETURN e.name as name"
-                results = self.graph.run(query).data()
-            
-            return [result['name'] for result in results]
+            return list(self.iter_all_entities(graph_name))
             
         except Exception as e:
             logger.error(f"Error getting entities: {e}")
             return []
     
+    def iter_all_triples(self, graph_name: str = None) -> Iterator[Dict[str, str]]:
+        """
+        Stream all triples from the database
+        
+        Args:
+            graph_name: Optional graph name filter
+            
+        Yields:
+            Triple dictionaries as they arrive from the server
+        """
+        if graph_name:
+            query = """
+            MATCH (s:Entity {graph_name: $graph_name})-[r:RELATION]->(o:Entity)
+            RETURN s.name as subject, r.type as predicate, o.name as object
+            """
+            records = self._stream(query, graph_name=graph_name)
+        else:
+            query = """
+            MATCH (s:Entity)-[r:RELATION]->(o:Entity)
+            RETURN s.name as subject, r.type as predicate, o.name as object
+            """
+            records = self._stream(query)
+        
+        for record in records:
+            yield record
+    
     def get_all_triples(self, graph_name: str = None) -> List[Dict[str, str]]:
         """
         Get all triples from the database
@@ -151,20 +298,7 @@ class Neo4jHandler:
             List of triple dictionaries
         """
         try:
-            if graph_name:
-                query = """
-                MATCH (s:Entity {graph_name: $graph_name})-[r:RELATION]->(o:Entity)
-                RETURN s.name as subject, r.type as predicate, o.name as object
-                """
-                results = self.graph.run(query, graph_name=graph_name).data()
-            else:
-                query = """
-                MATCH (s:Entity)-[r:RELATION]->(o:Entity)
-                RETURN s.name as subject, r.type as predicate, o.name as object
-                """
-                results = self.graph.run(query).data()
-            
-            return results
+            return list(self.iter_all_triples(graph_name))
             
         except Exception as e:
             logger.error(f"Error getting triples: {e}")
@@ -192,12 +326,12 @@ class Neo4jHandler:
                 RETURN [node in nodes(path) | node.name] as nodes,
                        [rel in relationships(path) | rel.type] as relationships
                 """
-                result = self.graph.run(
+                result = self._read(
                     query,
                     start=start_entity,
                     end=end_entity,
                     graph_name=graph_name
-                ).data()
+                )
             else:
                 query = """
                 MATCH path = shortestPath(
@@ -206,7 +340,7 @@ class Neo4jHandler:
                 RETURN [node in nodes(path) | node.name] as nodes,
                        [rel in relationships(path) | rel.type] as relationships
                 """
-                result = self.graph.run(query, start=start_entity, end=end_entity).data()
+                result = self._read(query, start=start_entity, end=end_entity)
             
             return result
             
@@ -230,17 +364,17 @@ class Neo4jHandler:
             # Count nodes
             if graph_name:
                 node_query = "MATCH (e:Entity {graph_name: $graph_name}) RETURN count(e) as count"
-                stats['num_entities'] = self.graph.run(node_query, graph_name=graph_name).data()[0]['count']
+                stats['num_entities'] = self._read(node_query, graph_name=graph_name)[0]['count']
                 
                 # Count relationships
                 rel_query = "MATCH ()-[r:RELATION {graph_name: $graph_name}]->() RETURN count(r) as count"
-                stats['num_relationships'] = self.graph.run(rel_query, graph_name=graph_name).data()[0]['count']
+                stats['num_relationships'] = self._read(rel_query, graph_name=graph_name)[0]['count']
             else:
                 node_query = "MATCH (e:Entity) RETURN count(e) as count"
-                stats['num_entities'] = self.graph.run(node_query).data()[0]['count']
+                stats['num_entities'] = self._read(node_query)[0]['count']
                 
                 rel_query = "MATCH ()-[r:RELATION]->() RETURN count(r) as count"
-                stats['num_relationships'] = self.graph.run(rel_query).data()[0]['count']
+                stats['num_relationships'] = self._read(rel_query)[0]['count']
             
             return stats
             
@@ -260,7 +394,7 @@ class Neo4jHandler:
             MATCH (e:Entity {graph_name: $graph_name})
             DETACH DELETE e
             """
-            self.graph.run(query, graph_name=graph_name)
+            self._write(query, graph_name=graph_name)
             logger.info(f"Successfully deleted graph '{graph_name}'")
             
         except Exception as e:
@@ -3,9 +3,10 @@ python-dotenv
 groq
 networkx
 matplotlib
+pandas
 spacy
 pyvis
 neo4j
-py2neo
+orjson
 knowledge-extractor
 graph-builder
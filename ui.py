@@ -3,19 +3,68 @@ Knowledge Graph Extraction System
 Main Streamlit Application
 """
 
-import streamlit as st
 import os
+
+# Keep BLAS/OpenMP single-threaded so spaCy does not oversubscribe Streamlit's
+# server threads; this must run before numpy or spaCy is imported
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+import streamlit as st
+import streamlit.components.v1 as components
 from dotenv import load_dotenv
+from pyvis.network import Network
 import matplotlib.pyplot as plt
+import hashlib
+import html
+import io
 import json
+import logging
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-from kg_extractor import KnowledgeExtractor
+from kg_extractor import KnowledgeExtractor, chunk_text
 from kg_graph_builder import GraphBuilder
 from neo4j_handler import Neo4jHandler
+from kg_triples import dedupe_triples
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Resolution of the on-screen graph image and of the downloadable PNG
+DISPLAY_DPI = 150
+DOWNLOAD_DPI = 300
+
+# Height in pixels of the interactive graph
+GRAPH_HTML_HEIGHT = 600
+
+# Page header, emitted as a single element
+HEADER_HTML = (
+    '<p class="main-header">🧠 Knowledge Graph Extraction System</p>'
+    '<p class="sub-header">Extract structured knowledge from text using NLP and LLMs</p>'
+)
+
+# Sample text shown in the input box
+SAMPLE_TEXT = """Albert Einstein was a German-born theoretical physicist who developed 
+the theory of relativity. He was born in Ulm, Germany in 1879. Einstein won the Nobel Prize 
+in Physics in 1921 for his explanation of the photoelectric effect. He moved to the United 
+States in 1933 and became an American citizen in 1940. Einstein is widely regarded as one 
+of the most influential scientists of all time."""
+
+# Minimum number of seconds between redraws of a streamed LLM response
+STREAM_UPDATE_INTERVAL = 0.05
+
+# Maximum number of concurrent Groq requests, kept under the API rate limit
+LLM_CONCURRENCY = 10
+
+# Seconds an extraction result stays cached
+EXTRACT_CACHE_TTL = 3600
+
 # Page configuration
 st.markdown("""
     <style>
@@ -32,7 +81,7 @@ st.markdown("""
         text-align: center;
         margin-bottom: 2rem;
     }
-    .stButton>button {
+    .stButton>button, .stFormSubmitButton>button {
         width: 100%;
         background-color: #2E75B6;
         color: white;
@@ -62,10 +111,183 @@ def initialize_session_state():
     """Initialize session state variables"""
     if 'triples' not in st.session_state:
         st.session_state.triples = []
-    if 'graph' not in st.session_state:
-        st.session_state.graph = None
     if 'neo4j_connected' not in st.session_state:
         st.session_state.neo4j_connected = False
+    if 'neo4j_future' not in st.session_state:
+        st.session_state.neo4j_future = None
+
+
+def report_neo4j_write():
+    """Show a toast for a background Neo4j write that has finished since the last check"""
+    future = st.session_state.neo4j_future
+    if future is None or not future.done():
+        return
+    
+    st.session_state.neo4j_future = None
+    error = future.exception()
+    if error is None:
+        # Newly stored triples invalidate the cached query results
+        query_relationships.clear()
+        list_entities.clear()
+        st.toast(f"💾 Saved to Neo4j as '{st.session_state.neo4j_future_graph}'")
+    else:
+        st.toast(f"❌ Failed to save to Neo4j: {error}")
+
+
+@st.cache_resource
+def get_extractor(mode: str, api_key: Optional[str]) -> KnowledgeExtractor:
+    """Return a shared extractor so the spaCy model and Groq client stay loaded across reruns"""
+    return KnowledgeExtractor(groq_api_key=api_key)
+
+
+@st.cache_resource
+def get_neo4j_handler(uri: str, user: str, password: str) -> Neo4jHandler:
+    """Return a shared Neo4j handler so its driver is opened once per connection"""
+    return Neo4jHandler(uri, user, password)
+
+
+def run_extraction(extractor: KnowledgeExtractor, text: str, mode: str,
+                   batch_size: int = 1) -> List[Dict[str, str]]:
+    """Extract triples, sending LLM-mode text to Groq as concurrent batches of chunks"""
+    if mode == "llm":
+        # A failed request or unparseable response raises rather than yielding
+        # a partial result, so cached_extract never memoizes it
+        results = extractor.extract_many_llm_sync(
+            chunk_text(text),
+            concurrency=LLM_CONCURRENCY,
+            batch_size=batch_size,
+            raise_errors=True
+        )
+        return dedupe_triples([triple for chunk_triples in results for triple in chunk_triples])
+    
+    return extractor.extract(text, mode=mode)
+
+
+@st.cache_data(max_entries=64, ttl=EXTRACT_CACHE_TTL, show_spinner=False)
+def cached_extract(text: str, mode: str, api_key: Optional[str], batch_size: int = 1) -> List[Dict[str, str]]:
+    """Extract triples, memoized on the text and extraction settings"""
+    return run_extraction(get_extractor(mode, api_key), text, mode, batch_size=batch_size)
+
+
+@st.cache_resource
+def get_neo4j_executor() -> ThreadPoolExecutor:
+    """Return the background workers used for Neo4j writes, shared across reruns"""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def stream_extraction(extractor: KnowledgeExtractor, text: str) -> List[Dict[str, str]]:
+    """Extract triples with a streamed LLM response, redrawing the partial output at most every 50 ms"""
+    placeholder = st.empty()
+    pieces = []
+    last_update = time.monotonic()
+    
+    def on_delta(delta: str):
+        nonlocal last_update
+        pieces.append(delta)
+        now = time.monotonic()
+        if now - last_update >= STREAM_UPDATE_INTERVAL:
+            placeholder.code("".join(pieces), language="json")
+            last_update = now
+    
+    triples = extractor.extract_with_llm_streaming(text, on_delta)
+    placeholder.empty()
+    return triples
+
+
+def triples_key(triples: List[Dict[str, str]]) -> Tuple[Tuple[str, str, str], ...]:
+    """Return a hashable view of the triples for use as a cache key"""
+    return tuple((t['subject'], t['predicate'], t['object']) for t in triples)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def triples_cards_html(key: Tuple[Tuple[str, str, str], ...]) -> str:
+    """Build the card view of all triples as one escaped HTML block"""
+    return "".join(
+        f'<div class="triple-card">'
+        f'<b>Triple {i}:</b><br>'
+        f'<b>Subject:</b> {html.escape(subject)}<br>'
+        f'<b>Predicate:</b> {html.escape(predicate)}<br>'
+        f'<b>Object:</b> {html.escape(obj)}'
+        f'</div>'
+        for i, (subject, predicate, obj) in enumerate(key, 1)
+    )
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def triples_json(key: Tuple[Tuple[str, str, str], ...]) -> str:
+    """Serialize the triples for download, once per distinct set of triples"""
+    return json.dumps(
+        [{'subject': subject, 'predicate': predicate, 'object': obj} for subject, predicate, obj in key],
+        indent=2
+    )
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def builder_from_key(key: Tuple[Tuple[str, str, str], ...]) -> GraphBuilder:
+    """Build a graph from the hashable view of the triples, shared so every view reuses its layout cache"""
+    builder = GraphBuilder()
+    builder.build_graph([
+        {'subject': subject, 'predicate': predicate, 'object': obj}
+        for subject, predicate, obj in key
+    ])
+    return builder
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def graph_stats(key: Tuple[Tuple[str, str, str], ...]) -> Dict:
+    """Compute graph statistics once per distinct set of triples"""
+    return builder_from_key(key).get_graph_stats()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def central_nodes(key: Tuple[Tuple[str, str, str], ...], top_n: int) -> List[tuple]:
+    """Compute the most central nodes once per distinct set of triples"""
+    return builder_from_key(key).get_central_nodes(top_n)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def graph_html(key: Tuple[Tuple[str, str, str], ...]) -> str:
+    """Render the knowledge graph for the given triples as an interactive PyVis page"""
+    net = Network(height=f"{GRAPH_HTML_HEIGHT}px", width="100%", directed=True, cdn_resources="remote")
+    for subject, predicate, obj in key:
+        net.add_node(subject, label=subject)
+        net.add_node(obj, label=obj)
+        net.add_edge(subject, obj, label=predicate)
+    return net.generate_html()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_graph_png(key: Tuple[Tuple[str, str, str], ...], dpi: int) -> bytes:
+    """Render the knowledge graph for the given triples to PNG bytes"""
+    fig = builder_from_key(key).visualize()
+    
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def query_relationships(_handler: Neo4jHandler, entity: str, graph_name: str) -> List[Dict]:
+    """Query an entity's relationships, reusing results for a minute; query errors are raised, not cached"""
+    return _handler.fetch_entity_relationships(entity, graph_name=graph_name)
+
+
+@st.cache_data(ttl=30, max_entries=32, show_spinner=False)
+def list_entities(_handler: Neo4jHandler, graph_name: str) -> List[str]:
+    """List the entities of a graph, reusing results briefly; query errors are raised, not cached"""
+    return list(_handler.iter_all_entities(graph_name=graph_name))
+
+
+def warm_sample(mode: str) -> bool:
+    """Load the extractor and fill the extraction cache for the sample text; a cache hit while it is still there"""
+    try:
+        # Same arguments the Extract button uses for this mode without an API key
+        cached_extract(SAMPLE_TEXT, mode, None, 1)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not pre-extract sample text: {e}")
+        return False
 
 
 def connect_neo4j():
@@ -74,7 +296,7 @@ def connect_neo4j():
     neo4j_password = os.getenv("NEO4J_PASSWORD")
 
     try:
-        handler = Neo4jHandler(
+        handler = get_neo4j_handler(
             neo4j_uri,
             neo4j_user,
             neo4j_password
@@ -89,13 +311,60 @@ def connect_neo4j():
         return False
 
 
+@st.fragment
+def query_view():
+    """Neo4j query interface; widget interactions here rerun only this fragment"""
+    # Fragment reruns skip main(), so pick up a finished background write here
+    # before its stale query results can be served
+    report_neo4j_write()
+    
+    # Query interface for Neo4j
+    if st.session_state.neo4j_connected:
+        st.subheader("Query Neo4j Database")
+        
+        handler = st.session_state.neo4j_handler
+        graph_name = st.session_state.graph_name
+        
+        query_entity = st.text_input("Enter entity name to query:")
+        
+        if st.button("🔍 Query Entity"):
+            if query_entity:
+                with st.spinner("Querying..."):
+                    try:
+                        results = query_relationships(handler, query_entity, graph_name)
+                    except Exception as e:
+                        st.error(f"Neo4j query error: {e}")
+                    else:
+                        if results:
+                            st.write(f"Found {len(results)} relationships:")
+                            for result in results:
+                                st.write(f"**{result['subject']}** → *{result['predicate']}* → **{result['object']}**")
+                        else:
+                            # The entity may be written shortly; do not keep the miss
+                            query_relationships.clear(handler, query_entity, graph_name)
+                            st.info("No relationships found for this entity.")
+        
+        # Show all entities in database
+        if st.checkbox("Show all entities in database"):
+            try:
+                entities = list_entities(handler, graph_name)
+            except Exception as e:
+                st.error(f"Neo4j query error: {e}")
+            else:
+                if not entities:
+                    list_entities.clear(handler, graph_name)
+                st.write(f"**Entities ({len(entities)}):**", ", ".join(entities))
+    else:
+        st.info("Connect to Neo4j to enable querying features.")
+
+
 def main():
     """Main application function"""
     initialize_session_state()
+    report_neo4j_write()
     
     # Header
-    st.markdown('<p class="main-header">🧠 Knowledge Graph Extraction System</p>', unsafe_allow_html=True)
-    st.markdown('<p class="sub-header">Extract structured knowledge from text using NLP and LLMs</p>', unsafe_allow_html=True)
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
     
     # Sidebar
     with st.sidebar:
@@ -145,8 +414,24 @@ def main():
                 value=os.getenv('GROQ_API_KEY', ''),
                 help="Enter your Groq API key"
             )
+            llm_batch_size = st.slider(
+                "Passages per request:",
+                min_value=1,
+                max_value=20,
+                value=8,
+                help="Number of text chunks sent together in one LLM request. "
+                     "Larger batches mean fewer requests but a slower response each."
+            )
+            stream_llm = st.checkbox(
+                "Stream LLM response",
+                value=False,
+                help="Show the response as it is generated. Sends the whole text "
+                     "in one request and bypasses the result cache."
+            )
         else:
             groq_api_key = None
+            llm_batch_size = 1
+            stream_llm = False
         
         st.divider()
         
@@ -164,58 +449,53 @@ def main():
     with col1:
         st.header("📝 Input Text")
         
-        # Sample text
-        sample_text = """Albert Einstein was a German-born theoretical physicist who developed 
-the theory of relativity. He was born in Ulm, Germany in 1879. Einstein won the Nobel Prize 
-in Physics in 1921 for his explanation of the photoelectric effect. He moved to the United 
-States in 1933 and became an American citizen in 1940. Einstein is widely regarded as one 
-of the most influential scientists of all time."""
+        # Text input and Extract button share a form, so typing does not rerun the app
+        with st.form("extract_form"):
+            input_text = st.text_area(
+                "Enter text to extract knowledge from:",
+                value=SAMPLE_TEXT,
+                height=250,
+                help="Enter any text and we'll extract knowledge triples from it"
+            )
+            submitted = st.form_submit_button("🔍 Extract Knowledge", type="primary")
         
-        # Text input
-        input_text = st.text_area(
-            "Enter text to extract knowledge from:",
-            value=sample_text,
-            height=250,
-            help="Enter any text and we'll extract knowledge triples from it"
-        )
+        mode = "llm" if extraction_mode == "Online (LLM)" else "spacy"
+        extract_hash = hashlib.blake2b(f"{mode}|{input_text}".encode(), digest_size=16).hexdigest()
         
-        # Extract button
-        if st.button("🔍 Extract Knowledge", type="primary"):
+        if submitted:
             if not input_text.strip():
                 st.error("Please enter some text to extract knowledge from.")
+            elif st.session_state.get('last_extract_hash') == extract_hash and st.session_state.triples:
+                # Same text and mode as the triples already shown; skip re-extraction
+                st.info("Knowledge from this text is already extracted.")
             else:
                 with st.spinner("Extracting knowledge..."):
                     try:
-                        # Initialize extractor
-                        extractor = KnowledgeExtractor(groq_api_key=groq_api_key)
-                        
-                        # Extract triples
-                        mode = "llm" if extraction_mode == "Online (LLM)" else "spacy"
-                        triples = extractor.extract(input_text, mode=mode)
+                        if stream_llm:
+                            # Show the LLM response live while it is generated
+                            triples = stream_extraction(get_extractor(mode, groq_api_key), input_text)
+                        else:
+                            # Extract triples, reusing the result for text seen before
+                            triples = cached_extract(input_text, mode, groq_api_key, llm_batch_size)
                         
                         if not triples:
                             st.warning("No knowledge triples were extracted. Try with different text.")
                         else:
                             st.session_state.triples = triples
+                            st.session_state.last_extract_hash = extract_hash
                             
-                            # Build graph
-                            builder = GraphBuilder()
-                            graph = builder.build_graph(triples)
-                            st.session_state.graph = graph
-                            st.session_state.builder = builder
+                            # Write to Neo4j in the background (one batched UNWIND
+                            # transaction); the result is reported once it completes
+                            if neo4j_enabled and st.session_state.neo4j_connected:
+                                st.session_state.neo4j_future = get_neo4j_executor().submit(
+                                    st.session_state.neo4j_handler.store_triples,
+                                    triples,
+                                    graph_name=st.session_state.graph_name
+                                )
+                                st.session_state.neo4j_future_graph = st.session_state.graph_name
                             
                             st.success(f"✅ Extracted {len(triples)} knowledge triples!")
-                            
-                            # Store in Neo4j if enabled
-                            if neo4j_enabled and st.session_state.neo4j_connected:
-                                try:
-                                    st.session_state.neo4j_handler.store_triples(
-                                        triples,
-                                        graph_name=st.session_state.graph_name
-                                    )
-                                    st.success(f"💾 Saved to Neo4j as '{st.session_state.graph_name}'")
-                                except Exception as e:
-                                    st.error(f"Failed to save to Neo4j: {e}")
+                            report_neo4j_write()
                     
                     except Exception as e:
                         st.error(f"Error during extraction: {e}")
@@ -224,19 +504,21 @@ of the most influential scientists of all time."""
         st.header("📊 Extracted Triples")
         
         if st.session_state.triples:
-            # Display triples
-            for i, triple in enumerate(st.session_state.triples, 1):
-                st.markdown(f"""
-                <div class="triple-card">
-                    <b>Triple {i}:</b><br>
-                    <b>Subject:</b> {triple['subject']}<br>
-                    <b>Predicate:</b> {triple['predicate']}<br>
-                    <b>Object:</b> {triple['object']}
-                </div>
-                """, unsafe_allow_html=True)
+            # Display triples as a single table
+            st.dataframe(
+                pd.DataFrame(st.session_state.triples, columns=['subject', 'predicate', 'object']),
+                use_container_width=True
+            )
+            
+            # Card view is only rendered when asked for
+            if st.checkbox("Show as cards"):
+                st.markdown(
+                    triples_cards_html(triples_key(st.session_state.triples)),
+                    unsafe_allow_html=True
+                )
             
             # Download button
-            json_data = json.dumps(st.session_state.triples, indent=2)
+            json_data = triples_json(triples_key(st.session_state.triples))
             st.download_button(
                 label="📥 Download Triples (JSON)",
                 data=json_data,
@@ -247,31 +529,42 @@ of the most influential scientists of all time."""
             st.info("👆 Extract knowledge from text to see triples here")
     
     # Graph visualization section
-    if st.session_state.graph is not None:
+    if st.session_state.triples:
         st.header("🕸️ Knowledge Graph Visualization")
         
-        tab1, tab2, tab3 = st.tabs(["📈 Graph", "📊 Statistics", "🔍 Query"])
+        # Only the selected view is executed on each rerun, unlike st.tabs
+        view = st.radio(
+            "View",
+            ["📈 Graph", "📊 Statistics", "🔍 Query"],
+            horizontal=True,
+            label_visibility="collapsed"
+        )
         
-        with tab1:
-            # Visualize graph
-            fig = st.session_state.builder.visualize()
-            st.pyplot(fig)
+        if view == "📈 Graph":
+            key = triples_key(st.session_state.triples)
             
-            # Download graph button
-            img_buffer = io.BytesIO()
-            fig.savefig(img_buffer, format='png', dpi=300, bbox_inches='tight')
-            img_buffer.seek(0)
+            if st.checkbox("Interactive graph", value=True):
+                # Pan/zoom happens client-side in the cached PyVis page
+                components.html(graph_html(key), height=GRAPH_HTML_HEIGHT + 20)
+            else:
+                # Visualize graph from the cached render
+                st.image(render_graph_png(key, DISPLAY_DPI))
             
-            st.download_button(
-                label="📥 Download Graph (PNG)",
-                data=img_buffer,
-                file_name="knowledge_graph.png",
-                mime="image/png"
-            )
+            # The full-resolution PNG is only rendered when asked for
+            if st.button("🖼️ Prepare Graph PNG"):
+                with st.spinner("Rendering graph..."):
+                    png_data = render_graph_png(key, DOWNLOAD_DPI)
+                st.download_button(
+                    label="📥 Download Graph (PNG)",
+                    data=png_data,
+                    file_name="knowledge_graph.png",
+                    mime="image/png"
+                )
         
-        with tab2:
+        elif view == "📊 Statistics":
             # Display graph statistics
-            stats = st.session_state.builder.get_graph_stats()
+            key = triples_key(st.session_state.triples)
+            stats = graph_stats(key)
             
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -283,43 +576,17 @@ of the most influential scientists of all time."""
             
             # Central nodes
             st.subheader("Most Central Entities")
-            central_nodes = st.session_state.builder.get_central_nodes(5)
-            for node, score in central_nodes:
+            for node, score in central_nodes(key, 5):
                 st.write(f"**{node}**: {score:.3f}")
         
-        with tab3:
-            # Query interface for Neo4j
-            if st.session_state.neo4j_connected:
-                st.subheader("Query Neo4j Database")
-                
-                query_entity = st.text_input("Enter entity name to query:")
-                
-                if st.button("🔍 Query Entity"):
-                    if query_entity:
-                        with st.spinner("Querying..."):
-                            results = st.session_state.neo4j_handler.query_entity_relationships(
-                                query_entity,
-                                graph_name=st.session_state.graph_name
-                            )
-                            
-                            if results:
-                                st.write(f"Found {len(results)} relationships:")
-                                for result in results:
-                                    st.write(f"**{result['subject']}** → *{result['predicate']}* → **{result['object']}**")
-                            else:
-                                st.info("No relationships found for this entity.")
-                
-                # Show all entities in database
-                if st.checkbox("Show all entities in database"):
-                    entities = st.session_state.neo4j_handler.get_all_entities(
-                        graph_name=st.session_state.graph_name
-                    )
-                    st.write(f"**Entities ({len(entities)}):**", ", ".join(entities))
-            else:
-                st.info("Connect to Neo4j to enable querying features.")
+        elif view == "🔍 Query":
+            query_view()
+    
+    # Pre-extract the sample text once per spaCy-mode session, after the page has rendered
+    if mode == "spacy" and not st.session_state.setdefault('warmed', False):
+        st.session_state.warmed = True
+        warm_sample(mode)
 
 
 if __name__ == "__main__":
-    # Import required for streamlit
-    import io
     main()
\ No newline at end of file